@@ -1,16 +1,27 @@
 import argparse
-import json
+import asyncio
+import functools
 import logging
+import math
 import os
+import random
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import ciso8601
+import ijson
+import orjson
+import torch
 from bs4 import BeautifulSoup
 from qdrant_client import QdrantClient, models
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError
 from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer
 from dotenv import load_dotenv
 
 
@@ -19,6 +30,28 @@ logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
 # Load environment variables from the repo-level .env so CLI runs pick up secrets
 load_dotenv(Path(__file__).resolve().parents[1] / ".env")
 
+# Below this many docs a transform window runs in-process rather than in the worker pool
+MIN_DOCS_FOR_POOL = 1000
+
+# Qdrant's default indexing threshold (KB), restored once bulk upload completes
+QDRANT_INDEXING_THRESHOLD = 20000
+
+# Taxonomy lists copied into metadata, and the keys tried (in order) for each entry's name
+_TAXONOMY_FIELDS = ("sections", "categories", "tags")
+_NAME_KEYS = ("name", "text", "description", "slug")
+
+# Metadata timestamps that must be ISO 8601 UTC strings
+_TS_KEYS = ("publish_date", "datetime", "first_publish_date")
+
+# A "<" that doesn't open a complete tag, comment or declaration (e.g. "if a<b then")
+_STRAY_LT_RE = re.compile(r"<(?!/?[A-Za-z][^<>]*>|[!?])")
+
+# Tokenizer init args not carried over when reloading as a fast tokenizer
+_TOKENIZER_RELOAD_SKIP_ARGS = ("name_or_path", "use_fast", "tokenizer_class")
+
+# Collapses spaces/tabs around newlines; compiled once since it runs per text segment
+_WS_NL_RE = re.compile(r"[ \t]*\n[ \t]*")
+
 # Goal: if article text contains HTML, remove tags and keep the words
 def strip_html(raw: Optional[str]) -> str:
     if not raw:
@@ -27,8 +60,9 @@ def strip_html(raw: Optional[str]) -> str:
     # If text doesn't contain HTML, return the text as is
     if "<" not in raw_str and "&" not in raw_str:
         return raw_str
-    # Else, BeautifulSoup extracts plain text 
-    return BeautifulSoup(raw_str, "html.parser").get_text(separator="\n")
+    # Else, BeautifulSoup extracts plain text; lxml is faster but truncates at a stray "<"
+    parser = "html.parser" if _STRAY_LT_RE.search(raw_str) else "lxml"
+    return BeautifulSoup(raw_str, parser).get_text(separator="\n")
 
 # Goal: make text consistent and readable
 def normalize_text(text: str) -> str:
@@ -37,22 +71,16 @@ def normalize_text(text: str) -> str:
     # Replaces NBSP in text with a normal space
     text = text.replace("\xa0", " ")
     text = strip_html(text)
-    # Clean spaces around newlines
-    text = re.sub(r"[ \t]*\n[ \t]*", "\n", text)
+    # Clean spaces around newlines (plain single-line text has nothing to collapse)
+    if "\n" in text:
+        text = _WS_NL_RE.sub("\n", text)
     # Drop leading/trailing newlines
     return text.strip("\n")
 
 # Goal: if there are tags like ["news", "sports", "news"], keep only the first "news"
 def dedupe_preserve(seq: Iterable[str]) -> List[str]:
-    seen = set()
-    ordered: List[str] = []
-    for item in seq:
-        if not item:
-            continue
-        if item not in seen:
-            seen.add(item)
-            ordered.append(item)
-    return ordered
+    # dict preserves insertion order, so fromkeys dedupes without a Python-level loop
+    return list(dict.fromkeys(item for item in seq if item))
 
 
 # Goal: assemble plain text from content elements by normalizing and joining text blocks
@@ -60,34 +88,22 @@ def extract_text(content_elements: Optional[List[Dict[str, Any]]]) -> str:
     if not content_elements:
         return ""
 
-    segments: List[str] = []
-    for elem in content_elements:
-        etype = elem.get("type")
-        if etype == "text":
-            segments.append(elem.get("content", ""))
-
-    cleaned = []
-    for seg in segments:
-        normalized = normalize_text(seg)
-        if normalized:
-            cleaned.append(normalized)
-            
-    # Combine cleaned segments with spaces between them
-    combined = ""
-    for part in cleaned:
-        if not combined:
-            combined = part
-        else:
-            combined += " " + part
-    return combined
+    # Normalize text blocks in one pass, drop empties, then join with spaces
+    cleaned = [
+        normalize_text(elem.get("content", ""))
+        for elem in content_elements
+        if elem.get("type") == "text"
+    ]
+    return " ".join(seg for seg in cleaned if seg)
 
 
 # Goal: collect readable names from a list of taxonomy-like objects
-def collect_names(items: Iterable[Dict[str, Any]]) -> List[str]:
+def collect_names(items: Iterable[Dict[str, Any]], keys: Tuple[str, ...] = _NAME_KEYS) -> List[str]:
     names: List[str] = []
     for item in items:
-        for key in ("name", "text", "description", "slug"):
-            val = item.get(key)
+        get = item.get
+        for key in keys:
+            val = get(key)
             if val:
                 names.append(val)
                 break
@@ -109,15 +125,6 @@ def build_url(doc: Dict[str, Any]) -> Optional[str]:
 
 # Goal: extract and normalize metadata fields from the raw document
 def extract_metadata(doc: Dict[str, Any]) -> Dict[str, Any]:
-    taxonomy = doc.get("taxonomy") or {}
-    # Build sections, categories, tags
-    sections = dedupe_preserve(collect_names(taxonomy.get("sections") or []))
-    categories = dedupe_preserve(collect_names(taxonomy.get("categories") or []))
-    tags = dedupe_preserve(
-        tag.lstrip("@")
-        for tag in collect_names(taxonomy.get("tags") or [])
-    )
-
     thumb = None
     promo = doc.get("promo_items") or {}
     for key in ("basic", "lead_art", "square1x1"):
@@ -149,9 +156,13 @@ def extract_metadata(doc: Dict[str, Any]) -> Dict[str, Any]:
     if isinstance(website, str) and website.strip():
         metadata["website"] = website
 
-    metadata["sections"] = sections or []
-    metadata["categories"] = categories or []
-    metadata["tags"] = tags or []
+    # Build sections, categories, tags in a single walk over the taxonomy
+    taxonomy = doc.get("taxonomy") or {}
+    for field in _TAXONOMY_FIELDS:
+        names = collect_names(taxonomy.get(field) or [])
+        if field == "tags":
+            names = [tag.lstrip("@") for tag in names]
+        metadata[field] = dedupe_preserve(names)
 
     if isinstance(thumb, str) and thumb.strip():
         metadata["thumb"] = thumb
@@ -166,73 +177,261 @@ def transform_document(doc: Dict[str, Any]) -> Dict[str, Any]:
     return {"text": text, "metadata": metadata}
 
 
+# Goal: transform + validate one doc in a worker process, returning errors as strings so they pickle cleanly
+def _transform_worker(doc: Dict[str, Any]) -> Tuple[Any, Optional[Dict[str, Any]], Optional[str]]:
+    try:
+        transformed_doc = transform_document(doc)
+        validate_output(transformed_doc)
+        return doc.get("_id"), transformed_doc, None
+    except Exception as exc:
+        return doc.get("_id"), None, str(exc)
+
+
+# Goal: transform a stream of raw docs in bounded windows so input is never fully materialized
+def transform_documents(raw: Iterable[Dict[str, Any]], workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    transformed: List[Dict[str, Any]] = []
+    workers = workers or 1
+    executor: Optional[ProcessPoolExecutor] = None
+    # Executor.map submits its whole input up front, so feed it one window at a time
+    # Windows are never smaller than the pool threshold, so any worker count can reach the pool
+    window_size = max(workers * 64 * 4, MIN_DOCS_FOR_POOL)
+    try:
+        docs = iter(raw)
+        while True:
+            window = list(islice(docs, window_size))
+            if not window:
+                break
+            # Small windows stay in-process: pool startup and pickling would outweigh the work
+            if workers > 1 and len(window) >= MIN_DOCS_FOR_POOL:
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                # ~4 tasks per worker so the window spreads evenly across processes
+                chunksize = max(1, len(window) // (workers * 4))
+                results = executor.map(_transform_worker, window, chunksize=chunksize)
+            else:
+                results = map(_transform_worker, window)
+            for doc_id, transformed_doc, error in results:
+                if error is not None:
+                    logging.warning("Skipping doc %s: %s", doc_id, error)
+                    continue
+                transformed.append(transformed_doc)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return transformed
+
+
+# Goal: accept ISO 8601 UTC timestamps, taking the C parser fast path for full RFC 3339 values
+def _is_iso_utc(ts_val: str) -> bool:
+    try:
+        ciso8601.parse_rfc3339(ts_val)
+        return True
+    except ValueError:
+        pass
+    # Minute-precision, date-only and basic-format values aren't RFC 3339 but are valid ISO 8601
+    try:
+        datetime.fromisoformat(ts_val.replace("Z", "+00:00"))
+        return True
+    except ValueError:
+        return False
+
+
 # Goal: ensure required fields are present and embeddings match expected dimension
-def validate_output(doc: Dict[str, Any], embedding_dim: Optional[int] = None) -> None:
-    if not isinstance(doc.get("text"), str) or not doc["text"].strip():
-        raise ValueError("Invalid text field")
-    md = doc.get("metadata", {})
-    for key in ("external_id", "url"):
-        if not md.get(key):
-            raise ValueError(f"Missing required metadata.{key}")
-    for ts_key in ("publish_date", "datetime", "first_publish_date"):
-        ts_val = md.get(ts_key)
-        if ts_val is None:
-            continue
-        if not isinstance(ts_val, str):
-            raise ValueError(f"metadata.{ts_key} must be string in ISO 8601 UTC format YYYY-MM-DDTHH:MM:SS[.fff]Z")
-        if not ts_val.endswith("Z"):
-            raise ValueError(f"metadata.{ts_key} must end with Z (UTC)")
-        try:
-            datetime.fromisoformat(ts_val.replace("Z", "+00:00"))
-        except Exception:
-            raise ValueError(f"metadata.{ts_key} must match ISO 8601 UTC format YYYY-MM-DDTHH:MM:SS[.fff]Z")
+def validate_output(
+    doc: Dict[str, Any],
+    embedding_dim: Optional[int] = None,
+    skip_metadata_checks: bool = False,
+) -> None:
+    # Text/metadata are unchanged by embedding, so callers that already validated them can skip
+    if not skip_metadata_checks:
+        if not isinstance(doc.get("text"), str) or not doc["text"].strip():
+            raise ValueError("Invalid text field")
+        md = doc.get("metadata", {})
+        for key in ("external_id", "url"):
+            if not md.get(key):
+                raise ValueError(f"Missing required metadata.{key}")
+        for ts_key in _TS_KEYS:
+            ts_val = md.get(ts_key)
+            if ts_val is None:
+                continue
+            if not isinstance(ts_val, str):
+                raise ValueError(f"metadata.{ts_key} must be string in ISO 8601 UTC format YYYY-MM-DDTHH:MM:SS[.fff]Z")
+            if not ts_val.endswith("Z"):
+                raise ValueError(f"metadata.{ts_key} must end with Z (UTC)")
+            if not _is_iso_utc(ts_val):
+                raise ValueError(f"metadata.{ts_key} must match ISO 8601 UTC format YYYY-MM-DDTHH:MM:SS[.fff]Z")
     if embedding_dim and "embedding" in doc:
         emb = doc["embedding"]
         if not isinstance(emb, list) or len(emb) != embedding_dim:
             raise ValueError("Embedding dimension mismatch")
 
 
+# Goal: collapse duplicate texts (e.g. syndicated articles) so each body is embedded once
+def unique_texts(texts: Iterable[str]) -> Tuple[List[str], List[int]]:
+    """Return the distinct texts plus, per input, the index of its distinct text."""
+    index: Dict[str, int] = {}
+    positions = [index.setdefault(text, len(index)) for text in texts]
+    if len(index) < len(positions):
+        logging.info("Embedding %s unique texts for %s documents", len(index), len(positions))
+    return list(index), positions
+
+
+# Goal: pick the fastest available torch device for local embeddings
+def select_device() -> str:
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+# Goal: load a SentenceTransformer once per (model, device) and reuse it across calls
+@functools.lru_cache(maxsize=4)
+def get_sentence_transformer(model_name: str, device: str) -> SentenceTransformer:
+    model = SentenceTransformer(model_name, device=device)
+    # Tokenization runs on CPU before every batch; make sure the Rust-backed tokenizer is used
+    tokenizer = model.tokenizer
+    if not getattr(tokenizer, "is_fast", False):
+        # Reload from where SentenceTransformer resolved the tokenizer (local dir/subfolder/cache),
+        # carrying over the init args it was built with minus per-class vocab file paths
+        init_args = {
+            key: val
+            for key, val in tokenizer.init_kwargs.items()
+            if key not in _TOKENIZER_RELOAD_SKIP_ARGS and not key.endswith("_file")
+        }
+        try:
+            model.tokenizer = AutoTokenizer.from_pretrained(tokenizer.name_or_path, use_fast=True, **init_args)
+        except Exception as exc:
+            # e.g. sentencepiece/protobuf missing for the slow->fast conversion; the slow one still works
+            logging.warning("Could not load fast tokenizer for %s; keeping slow tokenizer: %s", model_name, exc)
+    if device == "cuda":
+        # fp16 halves memory traffic and runs on tensor cores
+        model.half()
+    return model.eval()
+
+
 # Goal: generate embeddings with SentenceTransformers and attach to docs
 def add_embeddings_sentence_transformers(docs: List[Dict[str, Any]], model_name: str) -> int:
-    model = SentenceTransformer(model_name)
+    device = select_device()
+    model = get_sentence_transformer(model_name, device)
     dim = model.get_sentence_embedding_dimension()
-    texts = [doc["text"] for doc in docs]
-    embeddings = model.encode(texts, batch_size=8, show_progress_bar=True)
-    for doc, emb in zip(docs, embeddings):
-        doc["embedding"] = emb.tolist()
-        validate_output(doc, embedding_dim=dim)
+    texts, positions = unique_texts(doc["text"] for doc in docs)
+    # Tokens past max_seq_length are dropped anyway, so don't tokenize whole long articles;
+    # ~4 chars/token on English text, doubled so the cut never lands inside the window
+    if model.max_seq_length:
+        max_chars = 8 * model.max_seq_length
+        texts = [text[:max_chars] for text in texts]
+    # Large batches keep accelerators saturated; CPU gains little past a few dozen
+    batch_size = 128 if device != "cpu" else 32
+    while True:
+        try:
+            embeddings = model.encode(
+                texts, batch_size=batch_size, show_progress_bar=True, convert_to_numpy=True
+            )
+            break
+        except torch.cuda.OutOfMemoryError:
+            if batch_size == 1:
+                raise
+            torch.cuda.empty_cache()
+            batch_size //= 2
+            logging.warning("CUDA out of memory; retrying with batch_size=%s", batch_size)
+    vectors = [emb.tolist() for emb in embeddings]
+    for doc, pos in zip(docs, positions):
+        doc["embedding"] = vectors[pos]
+        validate_output(doc, embedding_dim=dim, skip_metadata_checks=True)
     return dim
 
 
+# Goal: embed one batch with OpenAI, backing off exponentially when rate limited
+async def _embed_openai_batch(
+    client: AsyncOpenAI,
+    semaphore: asyncio.Semaphore,
+    model_name: str,
+    batch: List[str],
+    max_retries: int = 5,
+) -> List[List[float]]:
+    async with semaphore:
+        for attempt in range(max_retries + 1):
+            try:
+                response = await client.embeddings.create(model=model_name, input=batch)
+                break
+            except RateLimitError:
+                if attempt == max_retries:
+                    raise
+                delay = 2 ** attempt + random.random()
+                logging.warning("OpenAI rate limit hit; retrying batch in %.1fs", delay)
+                await asyncio.sleep(delay)
+    # Ensure ordering matches input using index
+    batch_embeddings: List[List[float]] = [None] * len(response.data)  # type: ignore
+    for item in response.data:
+        batch_embeddings[item.index] = item.embedding  # type: ignore
+    return batch_embeddings
+
+
 # Goal: generate embeddings with OpenAI and attach to docs
-def add_embeddings_openai(docs: List[Dict[str, Any]], model_name: str, batch_size: int = 100) -> int:
+def add_embeddings_openai(
+    docs: List[Dict[str, Any]],
+    model_name: str,
+    batch_size: int = 100,
+    concurrency: int = 8,
+) -> int:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("OPENAI_API_KEY not set")
-    client = OpenAI(api_key=api_key)
-    texts = [doc["text"] for doc in docs]
-    embeddings: List[List[float]] = []
-    for start in range(0, len(texts), batch_size):
-        batch = texts[start:start + batch_size]
-        response = client.embeddings.create(model=model_name, input=batch)
-        # Ensure ordering matches input using index
-        batch_embeddings: List[List[float]] = [None] * len(response.data)  # type: ignore
-        for item in response.data:
-            batch_embeddings[item.index] = item.embedding  # type: ignore
-        embeddings.extend(batch_embeddings)
+    texts, positions = unique_texts(doc["text"] for doc in docs)
+
+    # Requests are network-bound, so keep several batches in flight at once
+    async def _run() -> List[List[List[float]]]:
+        semaphore = asyncio.Semaphore(concurrency)
+        async with AsyncOpenAI(api_key=api_key) as client:
+            return await asyncio.gather(
+                *(
+                    _embed_openai_batch(client, semaphore, model_name, texts[start:start + batch_size])
+                    for start in range(0, len(texts), batch_size)
+                )
+            )
+
+    # gather preserves task order, so batches line up with the input texts
+    embeddings: List[List[float]] = [emb for batch in asyncio.run(_run()) for emb in batch]
 
     if not embeddings:
         raise ValueError("No embeddings returned from OpenAI")
     dim = len(embeddings[0])
-    for doc, emb in zip(docs, embeddings):
-        doc["embedding"] = emb
-        validate_output(doc, embedding_dim=dim)
+    for doc, pos in zip(docs, positions):
+        doc["embedding"] = embeddings[pos]
+        validate_output(doc, embedding_dim=dim, skip_metadata_checks=True)
     return dim
 
 
+# Goal: reuse one Qdrant client (and its HTTP connection pool) per endpoint
+@functools.lru_cache(maxsize=4)
+def get_qdrant_client(url: str, api_key: str) -> QdrantClient:
+    return QdrantClient(url=url, api_key=api_key)
+
+
+# Goal: block until Qdrant has applied every uploaded point, failing loudly if it doesn't
+def wait_for_points(client: QdrantClient, collection: str, expected: int, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        info = client.get_collection(collection_name=collection)
+        if info.status == models.CollectionStatus.RED:
+            raise RuntimeError(f"Qdrant collection '{collection}' entered RED status during upload")
+        count = client.count(collection_name=collection, exact=True).count
+        if count >= expected:
+            return
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Qdrant collection '{collection}' has {count}/{expected} points after {timeout:.0f}s")
+        time.sleep(0.5)
+
+
 # Goal: push the enriched documents into Qdrant using configured collection
-def push_to_qdrant(docs: List[Dict[str, Any]], vector_size: int) -> None:
-    """Upsert documents into a Qdrant collection using env configuration."""
+def push_to_qdrant(
+    docs: List[Dict[str, Any]],
+    vector_size: int,
+    batch_size: int = 64,
+    parallel: Optional[int] = None,
+) -> None:
+    """Upload documents into a Qdrant collection using env configuration."""
     url = os.getenv("QDRANT_URL")
     api_key = os.getenv("QDRANT_API_KEY")
     collection = os.getenv("QDRANT_COLLECTION", "documents")
@@ -241,26 +440,65 @@ def push_to_qdrant(docs: List[Dict[str, Any]], vector_size: int) -> None:
         logging.info("QDRANT_URL or QDRANT_API_KEY not set; skipping Qdrant upload.")
         return
 
-    client = QdrantClient(url=url, api_key=api_key)
+    client = get_qdrant_client(url, api_key)
 
+    # Create the collection with HNSW indexing off so it doesn't compete with the bulk load;
+    # full-precision vectors live on disk while int8 quantized copies stay in RAM for search
     client.recreate_collection(
         collection_name=collection,
-        vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE),
+        vectors_config=models.VectorParams(
+            size=vector_size,
+            distance=models.Distance.COSINE,
+            on_disk=True,
+            quantization_config=models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True),
+            ),
+        ),
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0),
     )
 
-    points = []
-    for idx, doc in enumerate(docs):
-        # Qdrant requires point IDs to be UUIDs or unsigned ints; use index to avoid format issues.
-        points.append(
-            models.PointStruct(
-                id=idx,
-                vector=doc["embedding"],
-                payload={**doc["metadata"], "text": doc["text"]},
-            )
-        )
+    # Qdrant requires point IDs to be UUIDs or unsigned ints; use index to avoid format issues.
+    ids = range(len(docs))
+    # Embeddings are already lists; the client batches them as-is for the JSON request body
+    vectors = [doc["embedding"] for doc in docs]
+    # Payloads are merged lazily as the client drains each batch
+    payloads = ({**doc["metadata"], "text": doc["text"]} for doc in docs)
+
+    # parallel > 1 starts a worker pool that re-imports this module; never spawn more
+    # workers than there are batches, so small API uploads stay in-process
+    if parallel is None:
+        parallel = min(os.cpu_count() or 1, math.ceil(len(docs) / batch_size))
+
+    # upload_collection batches, retries and fans out across worker processes
+    client.upload_collection(
+        collection_name=collection,
+        ids=ids,
+        vectors=vectors,
+        payload=payloads,
+        batch_size=batch_size,
+        parallel=max(1, parallel),
+        wait=False,
+    )
+    # Batches are sent without waiting, so confirm the server applied them before reporting success
+    wait_for_points(client, collection, len(docs))
 
-    client.upsert(collection_name=collection, points=points)
-    logging.info("Upserted %s vectors into Qdrant collection '%s'", len(points), collection)
+    # Re-enable indexing so the optimizer builds HNSW once over the full collection
+    client.update_collection(
+        collection_name=collection,
+        optimizer_config=models.OptimizersConfigDiff(indexing_threshold=QDRANT_INDEXING_THRESHOLD),
+    )
+    logging.info("Uploaded %s vectors into Qdrant collection '%s'", len(docs), collection)
+
+
+# Goal: stream docs to disk as a JSON array (the API parses it), one doc per line
+def write_documents(docs: Iterable[Dict[str, Any]], output_path: Path) -> None:
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with output_path.open("wb") as f:
+        f.write(b"[")
+        for idx, doc in enumerate(docs):
+            f.write(b"\n" if idx == 0 else b",\n")
+            f.write(orjson.dumps(doc))
+        f.write(b"\n]\n")
 
 
 # Goal: orchestrate the full pipeline from raw input to embeddings and optional Qdrant push
@@ -272,20 +510,14 @@ def run_pipeline(
     skip_embeddings: bool,
     provider: str,
     openai_model: str,
+    workers: Optional[int] = None,
 ) -> None:
-    # Read input file
-    raw = json.loads(input_path.read_text())
-    if limit:
-        raw = raw[:limit]
-
-    transformed: List[Dict[str, Any]] = []
-    for doc in raw:
-        try:
-            transformed_doc = transform_document(doc)
-            validate_output(transformed_doc)
-            transformed.append(transformed_doc)
-        except Exception as exc:
-            logging.warning("Skipping doc %s: %s", doc.get("_id"), exc)
+    # Stream docs from the input array instead of loading the whole file
+    with input_path.open("rb") as f:
+        raw: Iterator[Dict[str, Any]] = ijson.items(f, "item", use_float=True)
+        if limit:
+            raw = islice(raw, limit)
+        transformed = transform_documents(raw, workers)
 
     embedding_dim: Optional[int] = None
     embedding_model_used: Optional[str] = None
@@ -298,8 +530,7 @@ def run_pipeline(
             embedding_model_used = model_name
         logging.info("Embeddings generated with dimension %s", embedding_dim)
 
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    output_path.write_text(json.dumps(transformed, indent=2, ensure_ascii=False))
+    write_documents(transformed, output_path)
     logging.info("Wrote %s documents to %s", len(transformed), output_path)
     if embedding_dim:
         logging.info("Embedding provider=%s model=%s dim=%s", provider, embedding_model_used, embedding_dim)
@@ -331,7 +562,16 @@ def parse_args() -> argparse.Namespace:
         help="OpenAI embedding model name (used when provider=openai).",
     )
     parser.add_argument("--skip-embeddings", action="store_true", help="Skip embedding generation.")
-    return parser.parse_args()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Processes used to transform documents (1 disables multiprocessing).",
+    )
+    args = parser.parse_args()
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
 
 
 if __name__ == "__main__":
@@ -344,4 +584,5 @@ if __name__ == "__main__":
         skip_embeddings=args.skip_embeddings,
         provider=args.provider,
         openai_model=args.openai_model,
+        workers=args.workers,
     )